@@ -12,24 +12,39 @@ from __future__ import annotations
 
 import argparse
 import dataclasses
+import itertools
+import os
 import re
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Callable, Iterable, List
+from typing import Callable, Iterable, Iterator, List
 
 
 # Conjunto de símbolos musicales que indican cues no hablados
 MUSIC_SYMBOLS = {"♪", "♫", "♬", "♩", "♭", "♯"}
+# Tabla para str.translate que borra los símbolos musicales
+MUSIC_DELETE_TABLE = dict.fromkeys(map(ord, MUSIC_SYMBOLS))
 # Patrones para preservar etiquetas/overrides antes de limpiar
 BR_TAG_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
-HTML_TAG_RE = re.compile(r"<[^>]+>")
+# una etiqueta abierta por un '<' suelto no puede extenderse por encima de un <br>
+HTML_TAG_RE = re.compile(rf"<(?:(?!{BR_TAG_RE.pattern})[^>])+>", re.IGNORECASE)
 ASS_OVERRIDE_RE = re.compile(r"\{[^}]*\}")
 ASS_NEWLINE_RE = re.compile(r"\\[Nn]")
-# Forced detector regex: all caps (permit símbolos/espacios/dígitos) o override {\an8}
-FORCED_RE = re.compile(r"^[A-ZÁÉÍÓÚÑÜ\s\d\W]+$|^\{\\an8\}")
-
-
-@dataclasses.dataclass
+# Alternancias de los patrones anteriores: dos pasadas que respetan el orden <br> → HTML → {\...} → \N
+PROTECT_TAGS_RE = re.compile(f"{BR_TAG_RE.pattern}|{HTML_TAG_RE.pattern}", re.IGNORECASE)
+PROTECT_ASS_RE = re.compile(f"{ASS_OVERRIDE_RE.pattern}|{ASS_NEWLINE_RE.pattern}")
+# Bloques de acotaciones [] / () y espacios a normalizar
+SQUARE_BLOCK_RE = re.compile(r"\[[^\]]*\]")
+PAREN_BLOCK_RE = re.compile(r"\([^)]*\)")
+WHITESPACE_RE = re.compile(r"\s+")
+# Letras admitidas por el detector forced (el resto de letras/dígitos no decimales lo descartan)
+FORCED_UPPERCASE = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZÁÉÍÓÚÑÜ")
+
+
+@dataclasses.dataclass(slots=True)
 class SDHConfig:
     """Configura las reglas de limpieza SDH.
 
@@ -60,103 +75,146 @@ PRESETS: dict[str, SDHConfig] = {
 SPEAKER_RE = re.compile(r"^\s*([A-ZÁÉÍÓÚÜÑ0-9 '\"&().-]{2,}):\s*(.+)$")
 
 
-def _strip_speaker(line: str, cfg: SDHConfig) -> str:
+def _strip_speaker(line: str, only_uppercase: bool) -> str:
     """Elimina el prefijo antes de ':' si coincide con un speaker tag."""
-    if not cfg.remove_text_before_colon:
+    # sin ':' no puede haber speaker tag; evita recorrer la línea con la regex
+    if ":" not in line:
         return line
     match = SPEAKER_RE.match(line)
     if not match:
         return line
     speaker, rest = match.groups()
-    if cfg.colon_only_if_uppercase and speaker != speaker.upper():
+    if only_uppercase and speaker != speaker.upper():
         return line
     return rest
 
 
-def _only_music(line: str) -> bool:
-    """True si la línea contiene únicamente símbolos musicales definidos."""
-    stripped = line.strip()
-    if not stripped:
-        return False
-    return all(char in MUSIC_SYMBOLS for char in stripped)
-
-
-def _remove_inline_brackets(line: str, cfg: SDHConfig) -> str:
-    """Elimina contenido entre [] o () cuando no se exige línea completa."""
-    if cfg.remove_between_square and not cfg.between_only_if_separate_line:
-        line = re.sub(r"\[[^\]]*\]", "", line)
-    if cfg.remove_between_paren and not cfg.between_only_if_separate_line:
-        line = re.sub(r"\([^)]*\)", "", line)
-    return line
-
-
-def _should_drop_line_for_brackets(line: str, cfg: SDHConfig) -> bool:
-    """Descarta líneas que son solo un bloque []/() si así se configuró."""
-    if not cfg.between_only_if_separate_line:
-        return False
-    stripped = line.strip()
-    if cfg.remove_between_square and re.fullmatch(r"\[[^\]]*\]", stripped):
-        return True
-    if cfg.remove_between_paren and re.fullmatch(r"\([^)]*\)", stripped):
-        return True
-    return False
+def _build_cleaner(cfg: SDHConfig) -> Callable[[str], str | None]:
+    """Especializa la limpieza SDH para cfg, resolviendo una sola vez qué pasos aplican.
 
+    Devuelve una función línea → línea limpia (o None si se elimina) que solo ejecuta
+    las regex activadas, sin volver a consultar cfg en cada línea.
+    """
+    bracket_res = [
+        regex
+        for regex, enabled in ((SQUARE_BLOCK_RE, cfg.remove_between_square), (PAREN_BLOCK_RE, cfg.remove_between_paren))
+        if enabled
+    ]
+    if cfg.between_only_if_separate_line:
+        # solo se descartan las líneas que son un bloque []/() completo
+        drop_matchers = tuple(regex.fullmatch for regex in bracket_res)
+        inline_subs: tuple[Callable[[str, str], str], ...] = ()
+    else:
+        drop_matchers = ()
+        inline_subs = tuple(regex.sub for regex in bracket_res)
+    strip_speaker = cfg.remove_text_before_colon
+    only_uppercase = cfg.colon_only_if_uppercase
+    drop_music = cfg.remove_if_only_music_symbols
+
+    def _clean(line: str) -> str | None:
+        if drop_matchers:
+            stripped = line.strip()
+            for fullmatch in drop_matchers:
+                if fullmatch(stripped):
+                    return None
+
+        # proteger etiquetas/overrides antes de normalizar espacios
+        placeholders: list[str] = []
+
+        # la mayoría de cues son texto plano: solo se protege si hay '<', '{' o '\'
+        if "<" in line or "{" in line or "\\" in line:
+            def _store(m: re.Match[str]) -> str:
+                placeholders.append(m.group(0))
+                return f"__TAG_{len(placeholders)-1}__"
+
+            # <br> y HTML primero (toda etiqueta termina en '>'), luego overrides {\...} y saltos \N
+            if ">" in line:
+                line = PROTECT_TAGS_RE.sub(_store, line)
+            if "{" in line or "\\" in line:
+                line = PROTECT_ASS_RE.sub(_store, line)
+
+        for sub in inline_subs:
+            line = sub("", line)
+        if strip_speaker:
+            line = _strip_speaker(line, only_uppercase)
+        line = WHITESPACE_RE.sub(" ", line).strip()
+
+        # la línea ya está sin espacios en los extremos: si borrar los símbolos musicales
+        # la deja vacía, solo contenía música (y entonces empieza por uno; el diálogo normal
+        # se descarta por el primer carácter sin copiar la línea)
+        if drop_music and line and line[0] in MUSIC_SYMBOLS and not line.translate(MUSIC_DELETE_TABLE):
+            return None
+
+        # restaurar etiquetas y saltos preservando el texto original; en orden inverso para
+        # que un override {...} que haya envuelto una etiqueta ya protegida se restaure entero
+        for idx in range(len(placeholders) - 1, -1, -1):
+            line = line.replace(f"__TAG_{idx}__", placeholders[idx])
 
-def clean_line(line: str, cfg: SDHConfig) -> str | None:
-    """Limpia una línea SDH preservando etiquetas/overrides; devuelve None si se elimina."""
-    if _should_drop_line_for_brackets(line, cfg):
-        return None
+        return line
 
-    # proteger etiquetas/overrides antes de normalizar espacios
-    placeholders: list[str] = []
+    return _clean
 
-    def _store(m: re.Match[str]) -> str:
-        placeholders.append(m.group(0))
-        return f"__TAG_{len(placeholders)-1}__"
 
-    line = BR_TAG_RE.sub(_store, line)
-    line = HTML_TAG_RE.sub(_store, line)
-    # preserva cualquier override {\...} evitando que se elimine
-    line = ASS_OVERRIDE_RE.sub(_store, line)
-    line = ASS_NEWLINE_RE.sub(_store, line)
+# Limpiadores ya especializados, indexados por los valores de SDHConfig (como mucho 64)
+_CLEANERS: dict[tuple[bool, ...], Callable[[str], str | None]] = {}
 
-    line = _remove_inline_brackets(line, cfg)
-    line = _strip_speaker(line, cfg)
-    line = re.sub(r"\s+", " ", line).strip()
 
-    if cfg.remove_if_only_music_symbols and _only_music(line):
-        return None
+def _cleaner_for(cfg: SDHConfig) -> Callable[[str], str | None]:
+    """Devuelve el limpiador especializado para los valores actuales de cfg (memorizado)."""
+    key = (
+        cfg.remove_between_square,
+        cfg.remove_between_paren,
+        cfg.between_only_if_separate_line,
+        cfg.remove_text_before_colon,
+        cfg.colon_only_if_uppercase,
+        cfg.remove_if_only_music_symbols,
+    )
+    cleaner = _CLEANERS.get(key)
+    if cleaner is None:
+        cleaner = _CLEANERS[key] = _build_cleaner(cfg)
+    return cleaner
 
-    # restaurar etiquetas y saltos preservando el texto original
-    for idx, original in enumerate(placeholders):
-        line = line.replace(f"__TAG_{idx}__", original)
 
-    return line
+def clean_line(line: str, cfg: SDHConfig) -> str | None:
+    """Limpia una línea SDH preservando etiquetas/overrides; devuelve None si se elimina."""
+    return _cleaner_for(cfg)(line)
 
 
 def sdh_to_full_lines(lines: Iterable[str], cfg: SDHConfig) -> List[str]:
     """Aplica limpieza SDH a múltiples líneas y devuelve las resultantes."""
+    cleaner = _cleaner_for(cfg)
     cleaned: List[str] = []
     for line in lines:
-        result = clean_line(line.rstrip("\n"), cfg)
+        result = cleaner(line.rstrip("\n"))
         if result:
             cleaned.append(result)
     return cleaned
 
 
 def is_all_caps_cue(line: str) -> bool:
-    """Detecta cues forced usando la regex FORCED_RE, exige ≥2 letras."""
-    text = line.strip()
-    if not text:
-        return False
-    if not FORCED_RE.fullmatch(text):
+    """Detecta cues forced (solo mayúsculas, ≥2 letras) sin regex, en una sola pasada."""
+    if line.isascii():
+        # en ASCII basta isupper() (en C): una minúscula, ninguna letra o un '_' descartan
+        # el cue; si pasa, solo queda comprobar que haya al menos dos letras A-Z
+        if not line.isupper() or "_" in line:
+            return False
+        letters = 0
+        for c in line:
+            if c.isalpha():
+                letters += 1
+                if letters == 2:
+                    return True
         return False
 
+    letters = 0
+    for c in line:
+        if c in FORCED_UPPERCASE:
+            letters += 1
+        elif (c.isalnum() or c == "_") and not c.isdecimal():
+            # minúsculas, letras fuera de FORCED_UPPERCASE o '_' descartan el cue
+            return False
     # exigir al menos 2 letras alfabéticas en mayúsculas para evitar monosílabos
-    letters = [c for c in text if c.isalpha()]
-    if len(letters) < 2:
-        return False
-    return all(c.isupper() for c in letters)
+    return letters >= 2
 
 
 def full_to_forced_lines(lines: Iterable[str], cue_checker: Callable[[str], bool] | None = None) -> List[str]:
@@ -165,7 +223,7 @@ def full_to_forced_lines(lines: Iterable[str], cue_checker: Callable[[str], bool
     return [line for line in lines if checker(line)]
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class SRTBlock:
     """Bloque SRT simple (índice, timing y textos)."""
     index: str
@@ -173,20 +231,18 @@ class SRTBlock:
     texts: List[str]
 
 
-def parse_srt(lines: Iterable[str]) -> List[SRTBlock]:
-    """Parsea líneas en bloques SRT sin modificar el contenido de texto."""
-    blocks: List[SRTBlock] = []
+def parse_srt(lines: Iterable[str]) -> Iterator[SRTBlock]:
+    """Parsea líneas en bloques SRT (en streaming) sin modificar el contenido de texto."""
     buffer: List[str] = []
     for line in lines:
         if line.strip() == "":
             if buffer:
-                blocks.append(_make_block(buffer))
+                yield _make_block(buffer)
                 buffer = []
         else:
             buffer.append(line.rstrip("\n"))
     if buffer:
-        blocks.append(_make_block(buffer))
-    return blocks
+        yield _make_block(buffer)
 
 
 def _make_block(lines: List[str]) -> SRTBlock:
@@ -198,68 +254,141 @@ def _make_block(lines: List[str]) -> SRTBlock:
     return SRTBlock(index=index, timing=timing, texts=texts)
 
 
-def format_srt(blocks: List[SRTBlock], renumber: bool = True) -> List[str]:
-    """Convierte bloques SRT a líneas formateadas, renumerando si se desea."""
-    output: List[str] = []
+def format_srt(blocks: Iterable[SRTBlock], renumber: bool = True) -> Iterator[str]:
+    """Convierte bloques SRT a líneas formateadas (en streaming), renumerando si se desea."""
     counter = 1
     for block in blocks:
         if not block.texts:
             continue
-        output.append(str(counter if renumber else block.index or counter))
-        output.append(block.timing)
-        output.extend(block.texts)
-        output.append("")
+        yield str(counter if renumber else block.index or counter)
+        yield block.timing
+        yield from block.texts
+        yield ""
         counter += 1
-    return output
 
 
-def sdh_to_full_blocks(blocks: Iterable[SRTBlock], cfg: SDHConfig) -> List[SRTBlock]:
-    """Limpia textos de cada bloque SDH y descarta los vacíos."""
-    cleaned_blocks: List[SRTBlock] = []
+def _clean_block_with(block: SRTBlock, cleaner: Callable[[str], str | None]) -> SRTBlock | None:
+    """Limpia los textos de un bloque SDH con cleaner; None si queda vacío."""
+    new_texts: List[str] = []
+    for text in block.texts:
+        cleaned = cleaner(text)
+        if cleaned:
+            new_texts.append(cleaned)
+    if not new_texts:
+        return None
+    return SRTBlock(index=block.index, timing=block.timing, texts=new_texts)
+
+
+# Bloques por tarea enviada a cada proceso con --jobs
+_JOBS_BATCH_SIZE = 256
+
+
+def _clean_batch(batch: list[SRTBlock], cfg: SDHConfig) -> list[SRTBlock]:
+    """Limpia un lote de bloques en un proceso del pool; omite los que quedan vacíos."""
+    cleaner = _cleaner_for(cfg)
+    cleaned_blocks = (_clean_block_with(block, cleaner) for block in batch)
+    return [block for block in cleaned_blocks if block is not None]
+
+
+def sdh_to_full_blocks(blocks: Iterable[SRTBlock], cfg: SDHConfig, jobs: int = 1) -> Iterator[SRTBlock]:
+    """Limpia textos de cada bloque SDH y descarta los vacíos (en streaming).
+
+    Con jobs > 1 reparte lotes de bloques entre procesos (cada bloque es independiente)
+    sin tener en vuelo más de 2 × jobs lotes, así que la entrada se sigue leyendo a
+    medida que se escribe la salida; el orden de salida se conserva.
+    """
+    if jobs > 1:
+        block_iter = iter(blocks)
+        batches = iter(lambda: list(itertools.islice(block_iter, _JOBS_BATCH_SIZE)), [])
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending: deque[Future[list[SRTBlock]]] = deque(
+                executor.submit(_clean_batch, batch, cfg) for batch in itertools.islice(batches, 2 * jobs)
+            )
+            while pending:
+                future = pending.popleft()
+                # encolar el siguiente lote antes de esperar para no dejar procesos ociosos
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.append(executor.submit(_clean_batch, batch, cfg))
+                yield from future.result()
+        return
+    cleaner = _cleaner_for(cfg)
     for block in blocks:
-        new_texts: List[str] = []
-        for text in block.texts:
-            cleaned = clean_line(text, cfg)
-            if cleaned:
-                new_texts.append(cleaned)
-        if new_texts:
-            cleaned_blocks.append(SRTBlock(index=block.index, timing=block.timing, texts=new_texts))
-    return cleaned_blocks
-
-
-def full_to_forced_blocks(blocks: Iterable[SRTBlock], cue_checker: Callable[[str], bool] | None = None) -> List[SRTBlock]:
-    """Conserva bloques donde todas las líneas pasan el detector de forced."""
+        cleaned_block = _clean_block_with(block, cleaner)
+        if cleaned_block is not None:
+            yield cleaned_block
+
+
+def full_to_forced_blocks(blocks: Iterable[SRTBlock], cue_checker: Callable[[str], bool] | None = None) -> Iterator[SRTBlock]:
+    """Conserva (en streaming) bloques donde todas las líneas pasan el detector de forced."""
     checker = cue_checker or is_all_caps_cue
-    forced: List[SRTBlock] = []
     for block in blocks:
-        if block.texts and all(checker(_text_without_overrides(t)) for t in block.texts):
-            forced.append(block)
-    return forced
+        texts = block.texts
+        if not texts:
+            continue
+        # bucle explícito en vez de all(generador): corta en la primera línea que no pasa
+        for text in texts:
+            if not checker(_text_without_overrides(text)):
+                break
+        else:
+            yield block
 
 
 def _text_without_overrides(text: str) -> str:
     # Preserva el contenido con llaves en la salida, pero lo ignora al decidir mayúsculas
+    if "{" not in text:
+        return text
     return ASS_OVERRIDE_RE.sub("", text)
 
 
-def _read_lines(path: Path | None) -> List[str]:
-    """Lee líneas desde un archivo utf-8 o stdin si path es None."""
+def _read_lines(path: Path | None) -> Iterator[str]:
+    """Lee líneas de una en una desde un archivo utf-8 o stdin si path es None."""
     if path is None:
-        return [line.rstrip("\n") for line in sys.stdin]
-    return path.read_text(encoding="utf-8").splitlines()
+        for line in sys.stdin:
+            yield line.rstrip("\n")
+        return
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            yield line.rstrip("\n")
 
 
-def _write_lines(path: Path | None, lines: List[str]) -> None:
-    """Escribe líneas a disco (utf-8) o stdout si path es None."""
-    text = "\n".join(lines) + ("\n" if lines else "")
+def _write_lines(path: Path | None, lines: Iterable[str]) -> None:
+    """Escribe líneas según llegan a disco (utf-8, con búfer de 1 MiB) o stdout si path es None.
+
+    En disco se escribe a un temporal junto a path que solo lo sustituye al terminar: si la
+    entrada falla a mitad (p. ej. un .srt en Latin-1), la salida anterior queda intacta.
+    """
     if path is None:
-        print(text, end="")
-    else:
-        path.write_text(text, encoding="utf-8")
+        sys.stdout.writelines(line + "\n" for line in lines)
+        return
+    try:
+        mode = path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with open(fd, "w", encoding="utf-8", buffering=1 << 20) as handle:
+            handle.writelines(line + "\n" for line in lines)
+        # mkstemp crea el temporal con permisos 0600: conservar los del destino
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
 
 
 def _apply_overrides(cfg: SDHConfig, args: argparse.Namespace) -> SDHConfig:
-    cfg = dataclasses.replace(cfg)
+    # copia explícita del preset (sin la introspección de dataclasses.replace)
+    cfg = SDHConfig(
+        remove_between_square=cfg.remove_between_square,
+        remove_between_paren=cfg.remove_between_paren,
+        between_only_if_separate_line=cfg.between_only_if_separate_line,
+        remove_text_before_colon=cfg.remove_text_before_colon,
+        colon_only_if_uppercase=cfg.colon_only_if_uppercase,
+        remove_if_only_music_symbols=cfg.remove_if_only_music_symbols,
+    )
 
     if args.remove_between_square is not None:
         cfg.remove_between_square = args.remove_between_square
@@ -294,6 +423,13 @@ def build_parser() -> argparse.ArgumentParser:
     )
     parser.add_argument("-i", "--input", type=Path, help="Ruta del archivo de entrada (por defecto stdin)")
     parser.add_argument("-o", "--output", type=Path, help="Ruta del archivo de salida (por defecto stdout)")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Procesos para la limpieza SDH en sdh_to_full/sdh_to_forced (por defecto 1; útil en subtítulos muy largos)",
+    )
 
     parser.add_argument(
         "--remove-between-square",
@@ -344,19 +480,22 @@ def build_parser() -> argparse.ArgumentParser:
 def main(argv: list[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs debe ser al menos 1")
+    if args.jobs > 1 and args.mode == "full_to_forced":
+        parser.error("--jobs solo se aplica a los modos sdh_to_full y sdh_to_forced")
 
     cfg = PRESETS[args.preset]
     cfg = _apply_overrides(cfg, args)
 
-    lines = _read_lines(args.input)
-    blocks = parse_srt(lines)
+    blocks = parse_srt(_read_lines(args.input))
 
     if args.mode == "sdh_to_full":
-        result_blocks = sdh_to_full_blocks(blocks, cfg)
+        result_blocks = sdh_to_full_blocks(blocks, cfg, jobs=args.jobs)
     elif args.mode == "full_to_forced":
         result_blocks = full_to_forced_blocks(blocks)
     else:
-        full_blocks = sdh_to_full_blocks(blocks, cfg)
+        full_blocks = sdh_to_full_blocks(blocks, cfg, jobs=args.jobs)
         result_blocks = full_to_forced_blocks(full_blocks)
 
     output_lines = format_srt(result_blocks, renumber=True)
@@ -0,0 +1,172 @@
+import itertools
+import re
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from srt_pipeline import (
+    SDHConfig,
+    SRTBlock,
+    clean_line,
+    full_to_forced_blocks,
+    full_to_forced_lines,
+    is_all_caps_cue,
+    main,
+)
+
+FLAGS = (
+    "remove_between_square",
+    "remove_between_paren",
+    "between_only_if_separate_line",
+    "remove_text_before_colon",
+    "colon_only_if_uppercase",
+    "remove_if_only_music_symbols",
+)
+
+
+class TagProtectionTest(unittest.TestCase):
+    """La protección de etiquetas respeta el orden <br> → HTML → {\\...} → \\N."""
+
+    def test_stray_lt_does_not_swallow_br(self) -> None:
+        self.assertEqual(clean_line("I <3 you [LAUGHS]<br>ok", SDHConfig()), "I <3 you <br>ok")
+        self.assertEqual(clean_line("x < y (sighs)   <br>JOHN: hi", SDHConfig()), "x < y <br>JOHN: hi")
+
+    def test_html_tag_wins_over_unclosed_override(self) -> None:
+        self.assertEqual(clean_line("{[(<3}  \\N<i>", SDHConfig()), "{[(<3}  \\N<i>")
+
+    def test_tags_survive_cleaning_untouched(self) -> None:
+        self.assertEqual(clean_line("{\\an8}[RÍE]  Hola,   amigo", SDHConfig()), "{\\an8} Hola, amigo")
+        self.assertEqual(clean_line("Hola<BR/>  adiós <br >ok", SDHConfig()), "Hola<BR/> adiós <br >ok")
+        self.assertEqual(clean_line("<i>JOHN:</i>  hola", SDHConfig()), "<i>JOHN:</i> hola")
+
+    def test_override_wrapping_a_tag_is_restored_whole(self) -> None:
+        self.assertEqual(clean_line("{a <i> b}  x", SDHConfig()), "{a <i> b} x")
+
+
+class CleanLineTest(unittest.TestCase):
+    """Reglas de limpieza SDH para cada combinación de SDHConfig."""
+
+    def test_speaker_tags(self) -> None:
+        cfg = SDHConfig()
+        self.assertEqual(clean_line("JOHN: Hola", cfg), "Hola")
+        self.assertEqual(clean_line("DR. SMITH: Hola", cfg), "Hola")
+        self.assertEqual(clean_line("John: Hola", cfg), "John: Hola")
+        self.assertEqual(clean_line("A: hola", cfg), "A: hola")
+        self.assertEqual(clean_line("JOHN: Hola", SDHConfig(remove_text_before_colon=False)), "JOHN: Hola")
+
+    def test_music_only_lines(self) -> None:
+        cfg = SDHConfig()
+        self.assertIsNone(clean_line("♪♫", cfg))
+        self.assertIsNone(clean_line("  ♪♪ ", cfg))
+        self.assertEqual(clean_line("♪ la la ♪", cfg), "♪ la la ♪")
+        self.assertEqual(clean_line("♪♫", SDHConfig(remove_if_only_music_symbols=False)), "♪♫")
+
+    def test_every_flag_combination(self) -> None:
+        for values in itertools.product((False, True), repeat=len(FLAGS)):
+            cfg = SDHConfig(**dict(zip(FLAGS, values)))
+            square, paren, separate, colon, _, music = values
+            with self.subTest(cfg=cfg):
+                # bloque en su propia línea: se descarta (None) o se vacía ("") según el modo
+                self.assertEqual(clean_line("[SUSPIRA]", cfg), (None if separate else "") if square else "[SUSPIRA]")
+                self.assertEqual(clean_line("(ríe)", cfg), (None if separate else "") if paren else "(ríe)")
+
+                words = ["Hola", "[ríe]", "(tose)", "amigo"]
+                if square and not separate:
+                    words.remove("[ríe]")
+                if paren and not separate:
+                    words.remove("(tose)")
+                if not colon:
+                    words.insert(0, "JOHN:")
+                self.assertEqual(clean_line("JOHN: Hola [ríe]  (tose) amigo", cfg), " ".join(words))
+
+                self.assertEqual(clean_line("♪♫", cfg), None if music else "♪♫")
+
+    def test_long_malformed_lines(self) -> None:
+        # un backtracking polinómico tarda segundos en estas líneas; la limpieza correcta, milisegundos
+        for line in ("([<" * 300, "[<{" * 300, "{" * 900, "<" * 900, "< <br" * 180):
+            for cfg in (SDHConfig(), SDHConfig(between_only_if_separate_line=True)):
+                start = time.perf_counter()
+                cleaned = clean_line(line, cfg)
+                self.assertLess(time.perf_counter() - start, 1.0, f"{line[:12]!r}… ({len(line)} caracteres)")
+                self.assertEqual(cleaned, line)
+
+
+# Detector original, basado en regex; is_all_caps_cue debe aceptar exactamente lo mismo
+ORIGINAL_FORCED_RE = re.compile(r"^[A-ZÁÉÍÓÚÑÜ\s\d\W]+$|^\{\\an8\}")
+
+
+def _original_is_all_caps_cue(line: str) -> bool:
+    text = line.strip()
+    if not text or not ORIGINAL_FORCED_RE.fullmatch(text):
+        return False
+    letters = [c for c in text if c.isalpha()]
+    return len(letters) >= 2 and all(c.isupper() for c in letters)
+
+
+class ForcedDetectorTest(unittest.TestCase):
+    """Detector de cues forced: solo mayúsculas admitidas y al menos dos letras."""
+
+    def test_accepts(self) -> None:
+        for line in ("HOLA", "¡AYÚDAME!", "NO 2 VECES", "ÑU ÉL", "- ¿QUÉ?", "HOLA ⓐ"):
+            with self.subTest(line=line):
+                self.assertTrue(is_all_caps_cue(line))
+
+    def test_rejects(self) -> None:
+        for line in ("Hola", "A", "OK_GO", "123", "", "ÉL dijo", "ÇA VA", "{\\an8}"):
+            with self.subTest(line=line):
+                self.assertFalse(is_all_caps_cue(line))
+
+    def test_matches_original_regex_for_every_code_point(self) -> None:
+        for cp in range(0x110000):
+            c = chr(cp)
+            # "AB" + c: ¿c descarta el cue?  "A" + c: ¿c cuenta como segunda letra?
+            for line in ("AB" + c, "A" + c):
+                if is_all_caps_cue(line) != _original_is_all_caps_cue(line):
+                    self.fail(f"U+{cp:04X} en {line!r}")
+
+    def test_forced_blocks_ignore_overrides(self) -> None:
+        blocks = [
+            SRTBlock("1", "t", ["{\\an8}HOLA"]),
+            SRTBlock("2", "t", ["{\\an8}hola"]),
+            SRTBlock("3", "t", ["OK", "¡SÍ!"]),
+        ]
+        self.assertEqual([b.index for b in full_to_forced_blocks(blocks)], ["1", "3"])
+        self.assertEqual(full_to_forced_lines(["HOLA", "hola", "OK", "¡SÍ!"]), ["HOLA", "OK", "¡SÍ!"])
+
+
+class OutputFileTest(unittest.TestCase):
+    """-o solo se sustituye cuando toda la entrada se ha procesado."""
+
+    CUE = "1\n00:00:01,000 --> 00:00:02,000\nJOHN: Él está aquí\n\n"
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def test_undecodable_input_keeps_previous_output(self) -> None:
+        src = self.dir / "latin1.srt"
+        src.write_bytes((self.CUE * 5000).encode("latin-1"))
+        out = self.dir / "full.srt"
+        out.write_text("previa\n", encoding="utf-8")
+        with self.assertRaises(UnicodeDecodeError):
+            main(["--mode", "sdh_to_full", "-i", str(src), "-o", str(out)])
+        self.assertEqual(out.read_text(encoding="utf-8"), "previa\n")
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir()), ["full.srt", "latin1.srt"])
+
+    def test_missing_input_creates_no_output(self) -> None:
+        out = self.dir / "full.srt"
+        with self.assertRaises(FileNotFoundError):
+            main(["--mode", "sdh_to_full", "-i", str(self.dir / "missing.srt"), "-o", str(out)])
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_output_may_overwrite_input(self) -> None:
+        src = self.dir / "in.srt"
+        src.write_text(self.CUE * 3, encoding="utf-8")
+        main(["--mode", "sdh_to_full", "-i", str(src), "-o", str(src)])
+        self.assertEqual(src.read_text(encoding="utf-8").count("Él está aquí"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()